@@ -2,35 +2,167 @@
 
 import polars as pl
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import numpy as np
 from datetime import datetime
 import streamlit as st
+import streamlit.components.v1 as components
 import folium
+from folium.utilities import JsCode
 from streamlit_folium import st_folium
 import plotly.express as px
 import plotly.graph_objects as go
 from pathlib import Path
-import warnings
 from geopy.geocoders import Nominatim
+from geopy.adapters import RequestsAdapter
 from geopy.exc import GeocoderTimedOut, GeocoderServiceError
 import time
 import math
 import json
+import re
+import copy
+import logging
 import os
-warnings.filterwarnings('ignore')
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
 
 BOSTON_LAT, BOSTON_LON = 42.3601, -71.0589
+ROUTE_CACHE_FILE = os.path.expanduser("~/.bluebikes_routes.sqlite")
+GEOCODE_CACHE_FILE = os.path.expanduser("~/.bluebikes_geocache.sqlite")
+FAILED_ROUTE_TTL = 300
+OSRM_TABLE_MAX_DESTINATIONS = 99
+
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+)
+_SESSION.mount('http://', _ADAPTER)
+_SESSION.mount('https://', _ADAPTER)
+
+DIRECTION_NAMES = ('north', 'northeast', 'east', 'southeast', 'south', 'southwest', 'west', 'northwest')
+DIR_CENTERS = np.array([0, 45, 90, 135, 180, 225, 270, 315], dtype=np.float64)
+ZOOM_RADII = np.array([0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0])
+ZOOM_LEVELS = np.array([17, 16, 15, 14, 14, 13, 13])
+STATION_STATUS_COLUMNS = [
+    'num_bikes_available', 'num_ebikes_available', 'num_docks_available', 'is_renting', 'is_returning'
+]
+STATION_RESULT_COLUMNS = ['station_id', 'name', 'lat', 'lon', *STATION_STATUS_COLUMNS]
+MARKER_SOURCE_COLUMNS = [
+    'name', 'lat', 'lon', 'distance_miles', 'num_bikes_available', 'num_ebikes_available', 'num_docks_available'
+]
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    R = 3959
+    lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
+    return 2 * R * np.arcsin(np.sqrt(a))
+
+def open_cache_db(cache_file, schema):
+    try:
+        db = sqlite3.connect(cache_file, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(schema)
+        db.commit()
+        return db
+    except Exception as e:
+        logger.warning("Cache unavailable (%s): %s", cache_file, e)
+        return None
 
 class RoutingService:
-    def __init__(self):
+    def __init__(self, cache_file=ROUTE_CACHE_FILE):
         self.base_url = "https://router.project-osrm.org/route/v1/walking"
+        self.table_url = "https://router.project-osrm.org/table/v1/walking"
         self.cache = {}
+        self.db_lock = threading.Lock()
+        self.db = open_cache_db(
+            cache_file,
+            "CREATE TABLE IF NOT EXISTS routes (key TEXT PRIMARY KEY, miles REAL, expires_at REAL)"
+        )
+        self.migrate_cache_db()
+    
+    def migrate_cache_db(self):
+        if self.db is None:
+            return
+        
+        try:
+            columns = [row[1] for row in self.db.execute("PRAGMA table_info(routes)")]
+            if 'expires_at' not in columns:
+                self.db.execute("DELETE FROM routes WHERE miles IS NULL")
+                self.db.execute("ALTER TABLE routes ADD COLUMN expires_at REAL")
+            self.db.execute("CREATE INDEX IF NOT EXISTS routes_expires_at ON routes (expires_at)")
+            self.db.execute("DELETE FROM routes WHERE expires_at <= ?", (time.time(),))
+            self.db.commit()
+        except Exception as e:
+            logger.warning("Route cache unavailable: %s", e)
+            self.db = None
+    
+    def get_cached_entry(self, cache_key):
+        entry = self.cache.get(cache_key)
+        if entry is not None and entry[1] <= time.time():
+            self.cache.pop(cache_key, None)
+            return None
+        return entry
+    
+    def load_cached(self, cache_keys):
+        missing = [key for key in cache_keys if self.get_cached_entry(key) is None]
+        if not missing or self.db is None:
+            return
+        
+        try:
+            with self.db_lock:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    rows = self.db.execute(
+                        f"SELECT key, miles, expires_at FROM routes "
+                        f"WHERE key IN ({placeholders}) AND (expires_at IS NULL OR expires_at > ?)",
+                        [*chunk, time.time()]
+                    ).fetchall()
+                    self.cache.update(
+                        (key, (miles, float('inf') if expires_at is None else expires_at))
+                        for key, miles, expires_at in rows
+                    )
+        except Exception as e:
+            logger.warning("Route cache read error: %s", e)
+    
+    def store_cached(self, entries, ttl=None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        self.cache.update(
+            (key, (miles, float('inf') if expires_at is None else expires_at))
+            for key, miles in entries.items()
+        )
+        if not entries or self.db is None:
+            return
+        
+        try:
+            with self.db_lock:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO routes (key, miles, expires_at) VALUES (?, ?, ?)",
+                    [(key, miles, expires_at) for key, miles in entries.items()]
+                )
+                self.db.commit()
+        except Exception as e:
+            logger.warning("Route cache write error: %s", e)
+    
+    def get_cache_key(self, lat1, lon1, lat2, lon2):
+        return f"{round(lat1, 4)},{round(lon1, 4)}|{round(lat2, 5)},{round(lon2, 5)}"
     
     def get_walking_distance(self, lat1, lon1, lat2, lon2):
-        cache_key = f"{lat1:.6f},{lon1:.6f}->{lat2:.6f},{lon2:.6f}"
+        cache_key = self.get_cache_key(lat1, lon1, lat2, lon2)
         
-        if cache_key in self.cache:
-            return self.cache[cache_key]
+        self.load_cached([cache_key])
+        entry = self.get_cached_entry(cache_key)
+        if entry is not None:
+            return entry[0]
         
         try:
             url = f"{self.base_url}/{lon1},{lat1};{lon2},{lat2}"
@@ -41,7 +173,7 @@ class RoutingService:
                 'annotations': 'false'
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            response = _SESSION.get(url, params=params, timeout=10)
             response.raise_for_status()
             data = response.json()
             
@@ -51,96 +183,223 @@ class RoutingService:
                 
                 straight_distance = self.get_straight_distance(lat1, lon1, lat2, lon2)
                 if distance_miles > straight_distance * 3.0:
-                    self.cache[cache_key] = None
+                    self.store_cached({cache_key: None})
                     return None
                 
-                self.cache[cache_key] = distance_miles
+                self.store_cached({cache_key: distance_miles})
                 return distance_miles
             else:
-                self.cache[cache_key] = None
+                self.store_cached({cache_key: None}, ttl=FAILED_ROUTE_TTL)
                 return None
                 
         except Exception as e:
-            print(f"Routing error: {e}")
-            self.cache[cache_key] = None
+            logger.warning("Routing error: %s", e)
+            self.store_cached({cache_key: None}, ttl=FAILED_ROUTE_TTL)
             return None
     
+    def get_walking_distances_batch(self, lat, lon, dest_lats, dest_lons):
+        if len(dest_lats) == 0:
+            return []
+        
+        with ThreadPoolExecutor(max_workers=min(8, len(dest_lats))) as executor:
+            return list(executor.map(
+                lambda d_lat, d_lon: self.get_walking_distance(lat, lon, d_lat, d_lon),
+                dest_lats.tolist(), dest_lons.tolist()
+            ))
+    
+    def get_table_distances(self, lat, lon, dest_lats, dest_lons):
+        try:
+            coords = ';'.join(f"{d_lon},{d_lat}" for d_lat, d_lon in zip(dest_lats.tolist(), dest_lons.tolist()))
+            url = f"{self.table_url}/{lon},{lat};{coords}"
+            params = {
+                'sources': '0',
+                'annotations': 'distance'
+            }
+            
+            response = _SESSION.get(url, params=params, timeout=15)
+            response.raise_for_status()
+            data = response.json()
+            
+            if data['code'] != 'Ok':
+                raise Exception(f"OSRM table returned {data['code']}")
+            
+            distances_miles = np.array(data['distances'][0][1:], dtype=np.float64) * 0.000621371
+            if len(distances_miles) != len(dest_lats):
+                raise Exception("OSRM table returned an unexpected number of distances")
+            
+            return distances_miles
+            
+        except Exception as e:
+            logger.warning("Routing table error: %s", e)
+            return np.full(len(dest_lats), np.nan)
+    
+    def get_walking_distances_table(self, lat, lon, dest_lats, dest_lons):
+        cache_keys = [
+            self.get_cache_key(lat, lon, d_lat, d_lon)
+            for d_lat, d_lon in zip(dest_lats.tolist(), dest_lons.tolist())
+        ]
+        self.load_cached(cache_keys)
+        uncached = np.array(
+            [i for i, key in enumerate(cache_keys) if self.get_cached_entry(key) is None], dtype=np.intp
+        )
+        
+        if len(uncached) > 0:
+            uncached_lats = dest_lats[uncached]
+            uncached_lons = dest_lons[uncached]
+            
+            distances_miles = np.concatenate([
+                self.get_table_distances(
+                    lat, lon,
+                    uncached_lats[start:start + OSRM_TABLE_MAX_DESTINATIONS],
+                    uncached_lons[start:start + OSRM_TABLE_MAX_DESTINATIONS]
+                )
+                for start in range(0, len(uncached), OSRM_TABLE_MAX_DESTINATIONS)
+            ])
+            
+            straight_distances = self.get_straight_distance(lat, lon, uncached_lats, uncached_lons)
+            unroutable = distances_miles > straight_distances * 3.0
+            retry = np.isnan(distances_miles)
+            
+            self.store_cached({
+                cache_keys[i]: None if rejected else distance_miles
+                for i, distance_miles, rejected in zip(
+                    uncached[~retry].tolist(), distances_miles[~retry].tolist(), unroutable[~retry].tolist()
+                )
+            })
+            self.get_walking_distances_batch(lat, lon, uncached_lats[retry], uncached_lons[retry])
+        
+        return [self.cache.get(key, (None, 0))[0] for key in cache_keys]
+    
     def get_straight_distance(self, lat1, lon1, lat2, lon2):
-        R = 3959
-        lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
-        c = 2 * np.arcsin(np.sqrt(a))
-        return R * c
+        return haversine_np(lat1, lon1, lat2, lon2)
 
 class GeocodeService:
-    def __init__(self):
-        self.geolocator = Nominatim(user_agent="bluebikes_dashboard")
-        self.cache = {}
+    request_lock = threading.Semaphore(1)
+    last_request_time = 0.0
+    
+    def __init__(self, cache_file=GEOCODE_CACHE_FILE):
+        self.geolocator = Nominatim(user_agent="bluebikes_dashboard", adapter_factory=RequestsAdapter)
+        self.db_lock = threading.Lock()
+        self.db = open_cache_db(
+            cache_file,
+            "CREATE TABLE IF NOT EXISTS geocodes (key TEXT PRIMARY KEY, lat REAL, lon REAL, formatted_address TEXT)"
+        )
+    
+    def load_cached(self, cache_key):
+        if self.db is None:
+            return None
+        
+        try:
+            with self.db_lock:
+                row = self.db.execute(
+                    "SELECT lat, lon, formatted_address FROM geocodes WHERE key = ?", (cache_key,)
+                ).fetchone()
+        except Exception as e:
+            logger.warning("Geocode cache read error: %s", e)
+            return None
+        
+        if row is None:
+            return None
+        
+        return {
+            'lat': row[0],
+            'lon': row[1],
+            'formatted_address': row[2],
+            'success': True,
+            'error': None
+        }
+    
+    def store_cached(self, cache_key, result):
+        if self.db is None:
+            return
+        
+        try:
+            with self.db_lock:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO geocodes (key, lat, lon, formatted_address) VALUES (?, ?, ?, ?)",
+                    (cache_key, result['lat'], result['lon'], result['formatted_address'])
+                )
+                self.db.commit()
+        except Exception as e:
+            logger.warning("Geocode cache write error: %s", e)
+    
+    def rate_limited_geocode(self, query):
+        with GeocodeService.request_lock:
+            wait = 1.0 - (time.monotonic() - GeocodeService.last_request_time)
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                return self.geolocator.geocode(query, timeout=10)
+            finally:
+                GeocodeService.last_request_time = time.monotonic()
+    
+    def iter_search_addresses(self, address):
+        intersection_keywords = [' and ', ' & ', ' @ ', ' at ']
+        is_intersection = any(keyword in address.lower() for keyword in intersection_keywords)
+        
+        if not is_intersection:
+            if "boston" not in address.lower() and "ma" not in address.lower():
+                yield f"{address}, Boston, MA"
+            else:
+                yield address
+            return
+        
+        normalized_address = address.lower()
+        for keyword in intersection_keywords:
+            normalized_address = normalized_address.replace(keyword, ' and ')
+        
+        streets = [street.strip() for street in normalized_address.split(' and ')]
+        base_location = ", Boston, MA" if "boston" not in normalized_address else ""
+        
+        if len(streets) == 2:
+            street1, street2 = streets
+            yield f"{street1} and {street2}{base_location}"
+        
+        if "boston" not in normalized_address and "ma" not in normalized_address:
+            yield f"{normalized_address}, Boston, MA"
+            yield f"{address}, Boston, MA"
+        else:
+            yield normalized_address
+            yield address
+        
+        if len(streets) == 2:
+            yield f"{street1} & {street2}{base_location}"
+            yield f"{street1} at {street2}{base_location}"
+            yield f"intersection of {street1} and {street2}{base_location}"
+            yield f"{street1}/{street2}{base_location}"
     
     def geocode_address(self, address):
-        if address in self.cache:
-            return self.cache[address]
+        cache_key = address.lower().strip()
+        cached = self.load_cached(cache_key)
+        if cached is not None:
+            return cached
         
         try:
-            intersection_keywords = [' and ', ' & ', ' @ ', ' at ']
-            is_intersection = any(keyword in address.lower() for keyword in intersection_keywords)
-            
-            if is_intersection:
-                search_addresses = []
-                
-                normalized_address = address.lower()
-                for keyword in intersection_keywords:
-                    normalized_address = normalized_address.replace(keyword, ' and ')
-                
-                if "boston" not in normalized_address and "ma" not in normalized_address:
-                    search_addresses.append(f"{normalized_address}, Boston, MA")
-                    search_addresses.append(f"{address}, Boston, MA")
-                else:
-                    search_addresses.append(normalized_address)
-                    search_addresses.append(address)
+            seen = set()
+            for search_address in self.iter_search_addresses(address):
+                if search_address in seen:
+                    continue
+                seen.add(search_address)
                 
-                if ' and ' in normalized_address:
-                    streets = normalized_address.split(' and ')
-                    if len(streets) == 2:
-                        street1 = streets[0].strip()
-                        street2 = streets[1].strip()
-                        
-                        base_location = ", Boston, MA" if "boston" not in normalized_address else ""
-                        search_addresses.extend([
-                            f"{street1} & {street2}{base_location}",
-                            f"{street1} at {street2}{base_location}",
-                            f"intersection of {street1} and {street2}{base_location}",
-                            f"{street1}/{street2}{base_location}"
-                        ])
-            else:
-                if "boston" not in address.lower() and "ma" not in address.lower():
-                    search_addresses = [f"{address}, Boston, MA"]
-                else:
-                    search_addresses = [address]
-            
-            for search_address in search_addresses:
                 for attempt in range(2):
                     try:
-                        location = self.geolocator.geocode(search_address, timeout=10)
-                        if location:
-                            result = {
-                                'lat': location.latitude,
-                                'lon': location.longitude,
-                                'formatted_address': location.address,
-                                'success': True,
-                                'error': None
-                            }
-                            self.cache[address] = result
-                            return result
-                            
+                        location = self.rate_limited_geocode(search_address)
                     except GeocoderTimedOut:
                         if attempt < 1:
                             time.sleep(1)
-                            continue
-                        else:
-                            break
+                        continue
+                    
+                    if location:
+                        result = {
+                            'lat': location.latitude,
+                            'lon': location.longitude,
+                            'formatted_address': location.address,
+                            'success': True,
+                            'error': None
+                        }
+                        self.store_cached(cache_key, result)
+                        return result
+                    break
                 
         except Exception as e:
             pass
@@ -152,9 +411,61 @@ class GeocodeService:
             'success': False,
             'error': f"Could not find location for: {address}"
         }
-        self.cache[address] = result
         return result
 
+@st.cache_resource(show_spinner=False)
+def get_geocode_service():
+    return GeocodeService()
+
+@st.cache_data(ttl=3600, max_entries=1024, show_spinner=False)
+def _geocode_location(address):
+    result = get_geocode_service().geocode_address(address)
+    if not result['success']:
+        raise LookupError(result['error'])
+    return result
+
+def geocode(address):
+    try:
+        return _geocode_location(address)
+    except Exception:
+        return {
+            'lat': None,
+            'lon': None,
+            'formatted_address': None,
+            'success': False,
+            'error': f"Could not find location for: {address}"
+        }
+
+@st.cache_data(ttl=600, show_spinner=False)
+def _fetch_current_weather(base_url, api_key, lat, lon):
+    url = f"{base_url}/weather"
+    params = {
+        'lat': lat,
+        'lon': lon,
+        'appid': api_key,
+        'units': 'imperial'
+    }
+    
+    response = _SESSION.get(url, params=params, timeout=10)
+    response.raise_for_status()
+    data = response.json()
+    
+    return {
+        'temperature': data['main']['temp'],
+        'feels_like': data['main']['feels_like'],
+        'humidity': data['main']['humidity'],
+        'wind_speed': data['wind']['speed'] if 'wind' in data else 0,
+        'description': data['weather'][0]['description'].title(),
+        'icon': data['weather'][0]['icon']
+    }
+
+def classify_conditions(temp, wind):
+    if 65 <= temp <= 80 and wind < 15:
+        return "Perfect"
+    elif 50 <= temp <= 85 and wind < 20:
+        return "Good"
+    return "OK"
+
 class WeatherService:
     def __init__(self, api_key=None):
         self.api_key = api_key
@@ -165,119 +476,121 @@ class WeatherService:
             return None
         
         try:
-            url = f"{self.base_url}/weather"
-            params = {
-                'lat': lat,
-                'lon': lon,
-                'appid': self.api_key,
-                'units': 'imperial'
-            }
-            
-            response = requests.get(url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            return {
-                'temperature': data['main']['temp'],
-                'feels_like': data['main']['feels_like'],
-                'humidity': data['main']['humidity'],
-                'wind_speed': data['wind']['speed'] if 'wind' in data else 0,
-                'description': data['weather'][0]['description'].title(),
-                'icon': data['weather'][0]['icon']
-            }
-            
+            return _fetch_current_weather(self.base_url, self.api_key, round(lat, 2), round(lon, 2))
         except Exception:
             return None
 
+@st.cache_data(ttl=3600, show_spinner=False)
+def _fetch_gbfs_feed_urls():
+    gbfs_url = "http://gbfs.bluebikes.com/gbfs/gbfs.json"
+    response = _SESSION.get(gbfs_url, timeout=15)
+    response.raise_for_status()
+    gbfs_data = response.json()
+    
+    station_info_url = None
+    station_status_url = None
+    
+    for feed in gbfs_data['data']['en']['feeds']:
+        if feed['name'] == 'station_information':
+            station_info_url = feed['url']
+        elif feed['name'] == 'station_status':
+            station_status_url = feed['url']
+    
+    if not station_info_url or not station_status_url:
+        raise Exception("Could not find station data URLs")
+    
+    return station_info_url, station_status_url
+
+@st.cache_data(ttl=60, show_spinner=False)
+def _fetch_station_data():
+    station_info_url, station_status_url = _fetch_gbfs_feed_urls()
+    
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        station_info_future = executor.submit(_SESSION.get, station_info_url, timeout=15)
+        station_status_future = executor.submit(_SESSION.get, station_status_url, timeout=15)
+        station_info_response = station_info_future.result()
+        station_status_response = station_status_future.result()
+    
+    station_info_response.raise_for_status()
+    station_info = station_info_response.json()
+    
+    station_status_response.raise_for_status()
+    station_status = station_status_response.json()
+    
+    stations_df = pl.DataFrame(station_info['data']['stations'])
+    status_df = pl.DataFrame(station_status['data']['stations'])
+    
+    combined_df = stations_df.lazy().join(status_df.lazy(), on='station_id', how='left').with_columns(
+        pl.col('lat').cast(pl.Float64),
+        pl.col('lon').cast(pl.Float64)
+    ).collect()
+    return combined_df, datetime.now()
+
 class BlueBikesService:
     def __init__(self):
         self.stations_df = None
+        self.stations_lat = None
+        self.stations_lon = None
+        self.stations_lat_rad = None
+        self.stations_lon_rad = None
+        self.stations_cos_lat = None
+        self.stations_sin_lat = None
         self.last_update = None
     
-    def fetch_station_data(self):
-        print("Fetching live BlueBikes data...")
+    def fetch_station_data(self, force_refresh=False):
+        logger.info("Fetching live BlueBikes data...")
         
         try:
-            gbfs_url = "http://gbfs.bluebikes.com/gbfs/gbfs.json"
-            response = requests.get(gbfs_url, timeout=15)
-            response.raise_for_status()
-            gbfs_data = response.json()
-            
-            station_info_url = None
-            station_status_url = None
+            if force_refresh:
+                _fetch_station_data.clear()
             
-            for feed in gbfs_data['data']['en']['feeds']:
-                if feed['name'] == 'station_information':
-                    station_info_url = feed['url']
-                elif feed['name'] == 'station_status':
-                    station_status_url = feed['url']
-            
-            if not station_info_url or not station_status_url:
-                raise Exception("Could not find station data URLs")
-            
-            station_info_response = requests.get(station_info_url, timeout=15)
-            station_info_response.raise_for_status()
-            station_info = station_info_response.json()
-            
-            station_status_response = requests.get(station_status_url, timeout=15)
-            station_status_response.raise_for_status()
-            station_status = station_status_response.json()
-            
-            stations_df = pl.DataFrame(station_info['data']['stations'])
-            status_df = pl.DataFrame(station_status['data']['stations'])
-            
-            combined_df = stations_df.join(status_df, on='station_id', how='left')
+            combined_df, fetched_at = _fetch_station_data()
             
             self.stations_df = combined_df
-            self.last_update = datetime.now()
+            self.stations_lat = combined_df['lat'].to_numpy()
+            self.stations_lon = combined_df['lon'].to_numpy()
+            self.stations_lat_rad = np.radians(self.stations_lat)
+            self.stations_lon_rad = np.radians(self.stations_lon)
+            self.stations_cos_lat = np.cos(self.stations_lat_rad)
+            self.stations_sin_lat = np.sin(self.stations_lat_rad)
+            self.last_update = fetched_at
             
-            print(f"Fetched data for {len(combined_df)} BlueBikes stations!")
+            logger.info("Fetched data for %d BlueBikes stations", len(combined_df))
             return combined_df
             
         except Exception as e:
-            print(f"Error fetching BlueBikes data: {e}")
+            logger.error("Error fetching BlueBikes data: %s", e)
             return pl.DataFrame()
     
     def haversine_distance(self, lat1, lon1, lat2, lon2):
+        return haversine_np(lat1, lon1, lat2, lon2)
+    
+    def prefilter_stations(self, lat, lon, radius_miles, direction=None):
         R = 3959
-        lat1, lon1, lat2, lon2 = map(np.radians, [lat1, lon1, lat2, lon2])
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = np.sin(dlat/2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon/2)**2
-        c = 2 * np.arcsin(np.sqrt(a))
-        return R * c
-    
-    def get_bearing(self, lat1, lon1, lat2, lon2):
-        lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
-        dlon = lon2 - lon1
-        y = math.sin(dlon) * math.cos(lat2)
-        x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(dlon)
-        bearing = math.atan2(y, x)
-        bearing = math.degrees(bearing)
-        bearing = (bearing + 360) % 360
-        return bearing
-    
-    def is_in_direction(self, bearing, direction):
-        direction_ranges = {
-            'north': (337.5, 22.5),
-            'northeast': (22.5, 67.5),
-            'east': (67.5, 112.5),
-            'southeast': (112.5, 157.5),
-            'south': (157.5, 202.5),
-            'southwest': (202.5, 247.5),
-            'west': (247.5, 292.5),
-            'northwest': (292.5, 337.5),
-        }
+        max_dlat = radius_miles / 69.0
+        max_dlon = radius_miles / (69.0 * max(math.cos(math.radians(abs(lat) + max_dlat)), 1e-6))
+        idx = np.nonzero(
+            (np.abs(self.stations_lat - lat) <= max_dlat) & (np.abs(self.stations_lon - lon) <= max_dlon)
+        )[0]
         
-        if direction not in direction_ranges:
-            return True
+        qlat, qlon = math.radians(lat), math.radians(lon)
+        cos_qlat = math.cos(qlat)
+        cos_lat = self.stations_cos_lat[idx]
+        dlon = self.stations_lon_rad[idx] - qlon
         
-        start, end = direction_ranges[direction]
+        a = np.square(np.sin((self.stations_lat_rad[idx] - qlat) / 2))
+        a += cos_qlat * cos_lat * np.square(np.sin(dlon / 2))
+        distances = 2 * R * np.arcsin(np.sqrt(a))
+        mask = distances <= radius_miles
         
-        if start > end:
-            return bearing >= start or bearing <= end
-        else:
-            return start <= bearing <= end
+        if direction in DIRECTION_NAMES:
+            y = np.sin(dlon) * cos_lat
+            x = cos_qlat * self.stations_sin_lat[idx] - math.sin(qlat) * cos_lat * np.cos(dlon)
+            center = DIR_CENTERS[DIRECTION_NAMES.index(direction)]
+            delta = np.abs(((np.degrees(np.arctan2(y, x)) - center + 180) % 360) - 180)
+            mask &= delta <= 22.5
+        
+        return idx[mask], distances[mask]
     
     def get_stations_near_location(self, location_name, lat, lon, radius_miles, direction=None, force_refresh=False):
         if self.stations_df is None or self.stations_df.is_empty():
@@ -288,104 +601,51 @@ class BlueBikesService:
         if not force_refresh and cache_key in st.session_state.cached_stations:
             cached_data = st.session_state.cached_stations[cache_key]
             
-            updated_stations = []
-            station_lookup = {station.get('station_id'): station for station in self.stations_df.iter_rows(named=True)}
+            fresh = self.stations_df.select(['station_id', *STATION_STATUS_COLUMNS])
+            updated_stations = cached_data.drop(STATION_STATUS_COLUMNS).join(
+                fresh, on='station_id', how='inner'
+            ).select(cached_data.columns).sort('distance_miles')
             
-            for cached_station in cached_data:
-                station_id = cached_station.get('station_id')
-                current_station = station_lookup.get(station_id)
-                
-                if current_station:
-                    updated_station = dict(cached_station)
-                    updated_station['num_bikes_available'] = current_station.get('num_bikes_available', 0)
-                    updated_station['num_ebikes_available'] = current_station.get('num_ebikes_available', 0)
-                    updated_station['num_docks_available'] = current_station.get('num_docks_available', 0)
-                    updated_station['is_renting'] = current_station.get('is_renting', 1)
-                    updated_station['is_returning'] = current_station.get('is_returning', 1)
-                    updated_stations.append(updated_station)
-            
-            if updated_stations:
+            if not updated_stations.is_empty():
                 st.success("✅ Updated bike/dock availability using cached locations")
-                return pl.DataFrame(updated_stations).sort('distance_miles')
+                return updated_stations
             else:
                 st.warning("Cache expired, recalculating routes...")
                 del st.session_state.cached_stations[cache_key]
         
-        progress_bar = st.progress(0)
-        progress_text = st.empty()
-        progress_text.text("🚶‍♀️ Calculating walking routes...")
-        
-        straight_line_candidates = []
-        total_stations = len(self.stations_df)
-        
-        progress_text.text("Finding nearby stations...")
-        
-        for i, station in enumerate(self.stations_df.iter_rows(named=True)):
-            progress = i / total_stations
-            progress_bar.progress(progress)
-            
-            try:
-                station_lat = float(station.get('lat', 0))
-                station_lon = float(station.get('lon', 0))
-                straight_distance = self.haversine_distance(lat, lon, station_lat, station_lon)
-                
-                if straight_distance <= radius_miles:
-                    if direction and direction != 'all':
-                        bearing = self.get_bearing(lat, lon, station_lat, station_lon)
-                        if not self.is_in_direction(bearing, direction):
-                            continue
-                    
-                    station_copy = dict(station)
-                    station_copy['straight_distance'] = straight_distance
-                    straight_line_candidates.append(station_copy)
-                    
-            except (ValueError, TypeError):
-                continue
+        idx, straight_distances = self.prefilter_stations(lat, lon, radius_miles, direction)
         
-        progress_bar.progress(1.0)
-        progress_text.text(f"Found {len(straight_line_candidates)} nearby stations")
-        
-        if not straight_line_candidates:
-            time.sleep(1)
-            progress_bar.empty()
-            progress_text.empty()
+        if len(idx) == 0:
             return pl.DataFrame()
         
-        walkable_stations = []
-        routing_service = RoutingService()
-        routing_failures = 0
-        excluded_by_walking = 0
-        
-        progress_text.text("Calculating walking routes...")
+        routing_service = st.session_state.routing_service
         
-        for i, station in enumerate(straight_line_candidates):
-            progress = i / len(straight_line_candidates)
-            progress_bar.progress(progress)
-            
-            station_lat = float(station.get('lat', 0))
-            station_lon = float(station.get('lon', 0))
-            
-            walking_distance = routing_service.get_walking_distance(lat, lon, station_lat, station_lon)
-            
-            if walking_distance is None:
-                routing_failures += 1
-                continue
-            
-            if walking_distance > radius_miles:
-                excluded_by_walking += 1
-                continue
-            
-            station['distance_miles'] = walking_distance
-            station['area'] = location_name
-            walkable_stations.append(station)
+        progress_text = st.empty()
+        progress_text.text(f"🚶‍♀️ Calculating walking routes to {len(idx)} nearby stations...")
         
-        progress_bar.progress(1.0)
-        progress_text.text(f"Found {len(walkable_stations)} walkable stations")
+        walking_distances = routing_service.get_walking_distances_table(
+            lat, lon, self.stations_lat[idx], self.stations_lon[idx]
+        )
         
-        time.sleep(1)
-        progress_bar.empty()
         progress_text.empty()
         
+        candidates = self.stations_df.select(STATION_RESULT_COLUMNS)[idx].lazy().with_columns(
+            pl.Series('straight_distance', straight_distances),
+            pl.Series('distance_miles', walking_distances, dtype=pl.Float64),
+            pl.lit(location_name).alias('area')
+        )
+        
+        routing_summary, walkable_stations = pl.collect_all([
+            candidates.select(
+                pl.col('distance_miles').null_count().alias('routing_failures'),
+                (pl.col('distance_miles') > radius_miles).sum().alias('excluded_by_walking')
+            ),
+            candidates.filter(
+                pl.col('distance_miles').is_not_null() & (pl.col('distance_miles') <= radius_miles)
+            ).sort('distance_miles')
+        ])
+        routing_failures, excluded_by_walking = routing_summary.row(0)
+        
         if routing_failures > 0 or excluded_by_walking > 0:
             summary_parts = []
             if routing_failures > 0:
@@ -394,9 +654,9 @@ class BlueBikesService:
                 summary_parts.append(f"{excluded_by_walking} too far to walk")
             st.caption(f"Filtered out: {', '.join(summary_parts)}")
         
-        if walkable_stations:
+        if not walkable_stations.is_empty():
             st.session_state.cached_stations[cache_key] = walkable_stations
-            return pl.DataFrame(walkable_stations).sort('distance_miles')
+            return walkable_stations
         else:
             return pl.DataFrame()
 
@@ -423,6 +683,192 @@ def load_config():
         pass
     return {'api_key': '', 'favorites': {}, 'save_api_key': False}
 
+def add_marker_columns(stations, search_type):
+    bikes = pl.col('num_bikes_available')
+    ebikes = pl.col('num_ebikes_available')
+    docks = pl.col('num_docks_available')
+    name = pl.col('name').fill_null('Unknown')
+    distance = pl.col('distance_miles').round(1)
+    
+    if search_type == 'pickup':
+        color = (
+            pl.when(bikes == 0).then(pl.lit('red'))
+            .when(ebikes > 0).then(pl.lit('green'))
+            .when(bikes >= 5).then(pl.lit('blue'))
+            .otherwise(pl.lit('orange'))
+        )
+        popup_html = pl.format(
+            '<div style="width: 180px;"><b>{}</b><br>Walk: {} mi<br>E-bikes: {}<br>Regular: {}</div>',
+            name, distance, ebikes, (bikes - ebikes).clip(lower_bound=0)
+        )
+        tooltip_text = pl.format('{} | {} bikes', name, bikes)
+    else:
+        color = (
+            pl.when(docks == 0).then(pl.lit('red'))
+            .when(docks >= 5).then(pl.lit('green'))
+            .otherwise(pl.lit('orange'))
+        )
+        popup_html = pl.format(
+            '<div style="width: 180px;"><b>{}</b><br>Walk: {} mi<br>Free docks: {}</div>',
+            name, distance, docks
+        )
+        tooltip_text = pl.format('{} | {} docks', name, docks)
+    
+    stations = stations.with_columns(
+        pl.col('lat').cast(pl.Float64, strict=False),
+        pl.col('lon').cast(pl.Float64, strict=False)
+    ).drop_nulls(['lat', 'lon']).with_columns(
+        pl.col(c).fill_null(0).cast(pl.Int32)
+        for c in ['num_bikes_available', 'num_ebikes_available', 'num_docks_available']
+    )
+    
+    return stations.with_columns(
+        color.alias('color'),
+        popup_html.alias('popup_html'),
+        tooltip_text.alias('tooltip_text')
+    )
+
+STATION_FEATURE_CALLBACK = JsCode("""
+function (feature, layer) {
+    layer.bindPopup(feature.properties.popup, {maxWidth: 200});
+    layer.bindTooltip(feature.properties.tooltip);
+}
+""")
+
+def build_map(lat, lon, zoom_level, radius, search_type, address):
+    user_loc = [lat, lon]
+    radius_m = radius * 1609.34
+    
+    m = folium.Map(
+        location=user_loc,
+        zoom_start=zoom_level,
+        tiles='OpenStreetMap'
+    )
+    
+    search_icon = 'home' if search_type == 'pickup' else 'flag'
+    search_color = 'red' if search_type == 'pickup' else 'blue'
+    
+    folium.Marker(
+        location=user_loc,
+        popup=f"Your Location: {address}",
+        icon=folium.Icon(color=search_color, icon=search_icon, prefix='fa'),
+        tooltip="Your Location"
+    ).add_to(m)
+    
+    folium.Circle(
+        location=user_loc,
+        radius=radius_m,
+        popup=f"{radius} mile radius",
+        color=search_color,
+        fill=True,
+        fillColor=search_color,
+        fillOpacity=0.1,
+        opacity=0.5
+    ).add_to(m)
+    
+    return m
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def build_station_layer(search_type, stations_hash, _stations):
+    features = add_marker_columns(_stations.lazy(), search_type).select(
+        pl.struct(
+            pl.lit('Feature').alias('type'),
+            pl.struct(
+                pl.lit('Point').alias('type'),
+                pl.concat_list('lon', 'lat').alias('coordinates')
+            ).alias('geometry'),
+            pl.struct(
+                pl.col('color'),
+                pl.col('popup_html').alias('popup'),
+                pl.col('tooltip_text').alias('tooltip')
+            ).alias('properties')
+        ).alias('feature')
+    ).collect().to_series().to_list()
+    fg = folium.FeatureGroup(name="stations")
+    
+    folium.GeoJson(
+        {'type': 'FeatureCollection', 'features': features},
+        marker=folium.CircleMarker(radius=8, weight=2, fill=True, fill_opacity=0.8),
+        style_function=lambda feature: {
+            'color': feature['properties']['color'],
+            'fillColor': feature['properties']['color']
+        },
+        on_each_feature=STATION_FEATURE_CALLBACK
+    ).add_to(fg)
+    
+    return fg
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def build_map_html(lat, lon, zoom_level, radius, search_type, address, stations_hash, _stations):
+    m = build_map(lat, lon, zoom_level, radius, search_type, address)
+    copy.deepcopy(build_station_layer(search_type, stations_hash, _stations)).add_to(m)
+    folium.LatLngPopup().add_to(m)
+    return m.get_root().render()
+
+def parse_coordinates(text):
+    numbers = re.findall(r'-?\d+(?:\.\d+)?', text)
+    if len(numbers) != 2:
+        return None
+    lat, lon = float(numbers[0]), float(numbers[1])
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return {'lat': lat, 'lng': lon}
+
+@st.fragment
+def show_stations_map(location_result, radius, search_type, address, nearby_stations, interactive=True):
+    user_lat, user_lon = location_result['lat'], location_result['lon']
+    zoom_level = int(ZOOM_LEVELS[min(np.searchsorted(ZOOM_RADII, radius), len(ZOOM_LEVELS) - 1)])
+    
+    marker_source = nearby_stations.select(MARKER_SOURCE_COLUMNS)
+    stations_hash = int(marker_source.hash_rows().sum())
+    
+    if interactive:
+        m = build_map(user_lat, user_lon, zoom_level, radius, search_type, address)
+        fg = build_station_layer(search_type, stations_hash, marker_source)
+        
+        map_data = st_folium(
+            m,
+            feature_group_to_add=copy.deepcopy(fg),
+            width=1000,
+            height=500,
+            key="stations_map",
+            returned_objects=["last_clicked"]
+        )
+    else:
+        coordinates = st.text_input(
+            "Coordinates from map:",
+            placeholder="Click the map and paste the popup here, e.g. Latitude: 42.3601 Longitude: -71.0589",
+            key=f"map_coordinates_{search_type}"
+        )
+        components.html(
+            build_map_html(user_lat, user_lon, zoom_level, radius, search_type, address, stations_hash, marker_source),
+            height=500,
+            scrolling=False
+        )
+        map_data = {'last_clicked': parse_coordinates(coordinates) if coordinates else None}
+        if coordinates and map_data['last_clicked'] is None:
+            st.warning("Couldn't read coordinates. Paste the latitude and longitude shown in the map popup.")
+    
+    if map_data['last_clicked'] is not None:
+        clicked_lat = map_data['last_clicked']['lat']
+        clicked_lng = map_data['last_clicked']['lng']
+        clicked_distance = haversine_np(user_lat, user_lon, clicked_lat, clicked_lng)
+        
+        if clicked_distance > 0.05:
+            if st.button(f"Search here ({clicked_distance:.1f}mi away)"):
+                new_address = f"Map Location {clicked_lat:.4f}, {clicked_lng:.4f}"
+                location_key = f"{new_address}_{search_type}"
+                st.session_state.locations[location_key] = {
+                    'lat': clicked_lat, 'lon': clicked_lng,
+                    'formatted_address': f"Map Location ({clicked_lat:.4f}, {clicked_lng:.4f})",
+                    'success': True, 'error': None
+                }
+                if search_type == 'pickup':
+                    st.session_state.pickup_address = new_address
+                else:
+                    st.session_state.dropoff_address = new_address
+                st.rerun(scope="app")
+
 def create_streamlit_app():
     st.set_page_config(
         page_title="BlueBikes",
@@ -436,8 +882,6 @@ def create_streamlit_app():
         st.session_state.bluebikes_service = BlueBikesService()
     if 'weather_service' not in st.session_state:
         st.session_state.weather_service = WeatherService()
-    if 'geocode_service' not in st.session_state:
-        st.session_state.geocode_service = GeocodeService()
     if 'routing_service' not in st.session_state:
         st.session_state.routing_service = RoutingService()
     if 'locations' not in st.session_state:
@@ -526,6 +970,12 @@ def create_streamlit_app():
                     del st.session_state.favorites[selected_favorite]
                     save_config(st.session_state.saved_api_key, st.session_state.favorites, st.session_state.save_api_key)
         
+        interactive_map = st.checkbox(
+            "Interactive map",
+            value=True,
+            help="Turn off to load the map as plain HTML and search by pasting clicked coordinates"
+        )
+        
         auto_refresh = st.checkbox("Auto-refresh", value=False)
         if auto_refresh:
             refresh_interval = st.selectbox("Interval:", [30, 60, 120, 300], index=2,
@@ -552,7 +1002,7 @@ def create_streamlit_app():
     except ValueError:
         current_radius_index = 2
     
-    direction_options = ['all', 'north', 'northeast', 'east', 'southeast', 'south', 'southwest', 'west', 'northwest']
+    direction_options = ['all', *DIRECTION_NAMES]
     current_direction_value = st.session_state.pickup_direction if search_type == 'pickup' else st.session_state.dropoff_direction
     try:
         current_direction_index = direction_options.index(current_direction_value)
@@ -610,7 +1060,7 @@ def create_streamlit_app():
         location_key = f"{address}_{search_type}"
         if location_key not in st.session_state.locations:
             with st.spinner("Finding location..."):
-                location_result = st.session_state.geocode_service.geocode_address(address)
+                location_result = geocode(address)
                 st.session_state.locations[location_key] = location_result
         else:
             location_result = st.session_state.locations[location_key]
@@ -634,7 +1084,7 @@ def create_streamlit_app():
                     st.success("Saved!")
             with refresh_col:
                 if st.button("Refresh"):
-                    st.session_state.bluebikes_service.fetch_station_data()
+                    st.session_state.bluebikes_service.fetch_station_data(force_refresh=True)
                     st.success("✅ Updated bike/dock availability!")
                     st.rerun()
             
@@ -649,14 +1099,7 @@ def create_streamlit_app():
                 with w_col3:
                     st.metric("Wind", f"{weather['wind_speed']:.0f} mph")
                 with w_col4:
-                    temp = weather['temperature']
-                    wind = weather['wind_speed']
-                    if 65 <= temp <= 80 and wind < 15:
-                        st.metric("Conditions", "Perfect")
-                    elif 50 <= temp <= 85 and wind < 20:
-                        st.metric("Conditions", "Good")
-                    else:
-                        st.metric("Conditions", "OK")
+                    st.metric("Conditions", classify_conditions(weather['temperature'], weather['wind_speed']))
             
         else:
             st.error(f"Error: {location_result['error']}")
@@ -688,10 +1131,12 @@ def create_streamlit_app():
             total_stations = len(nearby_stations)
             
             if search_type == 'pickup':
-                total_bikes = sum(s.get('num_bikes_available', 0) for s in nearby_stations.iter_rows(named=True))
-                total_ebikes = sum(s.get('num_ebikes_available', 0) for s in nearby_stations.iter_rows(named=True))
+                total_bikes, total_ebikes, stations_with_bikes = nearby_stations.select(
+                    pl.col('num_bikes_available').sum().alias('bikes'),
+                    pl.col('num_ebikes_available').sum().alias('ebikes'),
+                    (pl.col('num_bikes_available') > 0).sum().alias('with_bikes')
+                ).row(0)
                 total_regular = total_bikes - total_ebikes
-                stations_with_bikes = sum(1 for s in nearby_stations.iter_rows(named=True) if s.get('num_bikes_available', 0) > 0)
                 
                 metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
                 with metric_col1:
@@ -704,8 +1149,10 @@ def create_streamlit_app():
                     st.metric("E-bikes", total_ebikes)
                 
             else:
-                total_docks = sum(s.get('num_docks_available', 0) for s in nearby_stations.iter_rows(named=True))
-                stations_with_docks = sum(1 for s in nearby_stations.iter_rows(named=True) if s.get('num_docks_available', 0) > 0)
+                total_docks, stations_with_docks = nearby_stations.select(
+                    pl.col('num_docks_available').sum().alias('docks'),
+                    (pl.col('num_docks_available') > 0).sum().alias('with_docks')
+                ).row(0)
                 stations_full = total_stations - stations_with_docks
                 
                 metric_col1, metric_col2, metric_col3, metric_col4 = st.columns(4)
@@ -718,128 +1165,7 @@ def create_streamlit_app():
                 with metric_col4:
                     st.metric("Free Docks", total_docks)
             
-            zoom_levels = {0.1: 17, 0.25: 16, 0.5: 15, 0.75: 14, 1.0: 14, 1.5: 13, 2.0: 13}
-            zoom_level = zoom_levels.get(radius, 14)
-            
-            m = folium.Map(
-                location=[location_result['lat'], location_result['lon']],
-                zoom_start=zoom_level,
-                tiles='OpenStreetMap'
-            )
-            
-            search_icon = 'home' if search_type == 'pickup' else 'flag'
-            search_color = 'red' if search_type == 'pickup' else 'blue'
-            
-            folium.Marker(
-                location=[location_result['lat'], location_result['lon']],
-                popup=f"Your Location: {address}",
-                icon=folium.Icon(color=search_color, icon=search_icon, prefix='fa'),
-                tooltip="Your Location"
-            ).add_to(m)
-            
-            folium.Circle(
-                location=[location_result['lat'], location_result['lon']],
-                radius=radius * 1609.34,
-                popup=f"{radius} mile radius",
-                color=search_color,
-                fill=True,
-                fillColor=search_color,
-                fillOpacity=0.1,
-                opacity=0.5
-            ).add_to(m)
-            
-            for station in nearby_stations.iter_rows(named=True):
-                try:
-                    lat = float(station.get('lat', 0))
-                    lon = float(station.get('lon', 0))
-                    name = station.get('name', 'Unknown')
-                    distance = station.get('distance_miles', 0)
-                    
-                    if search_type == 'pickup':
-                        bikes = station.get('num_bikes_available', 0)
-                        ebikes = station.get('num_ebikes_available', 0)
-                        regular = bikes - ebikes if bikes >= ebikes else 0
-                        
-                        if bikes == 0:
-                            color = 'red'
-                            icon = 'ban'
-                        elif ebikes > 0:
-                            color = 'green'
-                            icon = 'bolt'
-                        elif bikes >= 5:
-                            color = 'blue'
-                            icon = 'bicycle'
-                        else:
-                            color = 'orange'
-                            icon = 'bicycle'
-                        
-                        popup_html = f"""
-                        <div style="width: 180px;">
-                            <b>{name}</b><br>
-                            Walk: {distance:.1f} mi<br>
-                            E-bikes: {ebikes}<br>
-                            Regular: {regular}
-                        </div>
-                        """
-                        
-                        tooltip_text = f"{name} | {bikes} bikes"
-                    
-                    else:
-                        docks = station.get('num_docks_available', 0)
-                        
-                        if docks == 0:
-                            color = 'red'
-                            icon = 'ban'
-                        elif docks >= 5:
-                            color = 'green'
-                            icon = 'home'
-                        else:
-                            color = 'orange'
-                            icon = 'home'
-                        
-                        popup_html = f"""
-                        <div style="width: 180px;">
-                            <b>{name}</b><br>
-                            Walk: {distance:.1f} mi<br>
-                            Free docks: {docks}
-                        </div>
-                        """
-                        
-                        tooltip_text = f"{name} | {docks} docks"
-                    
-                    folium.Marker(
-                        location=[lat, lon],
-                        popup=folium.Popup(popup_html, max_width=200),
-                        icon=folium.Icon(color=color, icon=icon, prefix='fa'),
-                        tooltip=tooltip_text
-                    ).add_to(m)
-                    
-                except (ValueError, TypeError):
-                    continue
-            
-            map_data = st_folium(m, width=1000, height=500, key="stations_map")
-            
-            if map_data['last_clicked'] is not None:
-                clicked_lat = map_data['last_clicked']['lat']
-                clicked_lng = map_data['last_clicked']['lng']
-                clicked_distance = st.session_state.bluebikes_service.haversine_distance(
-                    location_result['lat'], location_result['lon'], clicked_lat, clicked_lng
-                )
-                
-                if clicked_distance > 0.05:
-                    if st.button(f"Search here ({clicked_distance:.1f}mi away)"):
-                        new_address = f"Map Location {clicked_lat:.4f}, {clicked_lng:.4f}"
-                        location_key = f"{new_address}_{search_type}"
-                        st.session_state.locations[location_key] = {
-                            'lat': clicked_lat, 'lon': clicked_lng,
-                            'formatted_address': f"Map Location ({clicked_lat:.4f}, {clicked_lng:.4f})",
-                            'success': True, 'error': None
-                        }
-                        if search_type == 'pickup':
-                            st.session_state.pickup_address = new_address
-                        else:
-                            st.session_state.dropoff_address = new_address
-                        st.rerun()
+            show_stations_map(location_result, radius, search_type, address, nearby_stations, interactive_map)
         
         else:
             direction_text = "all directions" if direction == 'all' else f"the {direction} direction"